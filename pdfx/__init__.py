@@ -41,32 +41,47 @@ __copyright__ = "Copyright 2015 Chris Hager"
 import os
 import sys
 import json
+import mmap
 import shutil
 import logging
+import tempfile
 
 
 from .extractor import extract_urls
 from .backends import PDFMinerBackend, TextBackend
-from .downloader import download_urls
+from .downloader import download_urls, uses_proxy
 from .exceptions import FileNotFoundError, DownloadError, PDFInvalidError
 from pdfminer.pdfparser import PDFSyntaxError
 
+try:
+    import urllib3
+except ImportError:
+    # Fall back to urllib for remote PDFs
+    urllib3 = None
+
+try:
+    import orjson
+except ImportError:
+    # Fall back to json for the summary
+    orjson = None
 
 IS_PY2 = sys.version_info < (3, 0)
 
 if IS_PY2:
     # Python 2
-    from cStringIO import StringIO as BytesIO
     from urllib2 import Request, urlopen
 else:
     # Python 3
-    from io import BytesIO
     from urllib.request import Request, urlopen
 
     unicode = str
 
 logger = logging.getLogger(__name__)
 
+# Remote PDFs are kept in memory up to this size, larger ones go to disk
+SPOOL_MAX_SIZE = 8 << 20
+COPY_BUFSIZE = 64 << 10
+
 
 class PDFx(object):
     """
@@ -88,32 +103,69 @@ class PDFx(object):
     uri = None  # Original URI
     fn = None  # Filename part of URI
     is_url = False  # False if file
+    is_stream = False  # True if a file-like object was passed
     is_pdf = True
 
-    stream = None  # ByteIO Stream
+    stream = None  # File-like PDF content (mmap, file or spooled download)
     reader = None  # ReaderBackend
-    summary = {}
+    _summary = None  # Summary without references (added on first access)
+
+    # Connection pool shared by all instances, so that fetching several PDFs
+    # from the same host reuses connections (None: fall back to urllib)
+    _http = None
+    if urllib3:
+        _http = urllib3.PoolManager(
+            num_pools=16, maxsize=16, retries=urllib3.Retry(3), block=False
+        )
+
+    @classmethod
+    def configure_http(cls, pool):
+        """
+        Set the connection pool used to fetch remote PDFs
+        - `pool` is a `urllib3.PoolManager` (or None to use urllib)
+
+        Urls which go through a proxy from the environment (`http_proxy`
+        etc.) are always fetched with urllib, as the pool ignores those.
+
+        Referenced PDFs are downloaded with a separate pool which doesn't
+        verify certificates (see `downloader.http_pool`), pass it to
+        `download_pdfs` to use this one for them as well.
+        """
+        cls._http = pool
 
-    def __init__(self, uri):
+    def __init__(self, uri, annot_only=False, parse_xmp=True, cache=False):
         """
         Open PDF handle and parse PDF metadata
-        - `uri` can bei either a filename or an url
+        - `uri` can bei either a filename, an url or an opened binary
+          file-like object (eg. `io.BytesIO`)
+        - `annot_only` skips text extraction and only collects references
+          from link annotations
+        - `parse_xmp=False` skips the XMP metadata if the document info
+          already has a title
+        - `cache=True` reuses the result if the same PDF was recently parsed
+          with `cache=True` as well (see `backends.CACHE_MAXSIZE`)
         """
         logger.debug("Init with uri: %s" % uri)
 
         self.uri = uri
 
-        # Find out whether pdf is an URL or local file
-        url = extract_urls(uri)
-        self.is_url = len(url)
+        # Find out whether pdf is a file-like object, an URL or local file
+        self.is_stream = hasattr(uri, "read")
+        if not self.is_stream:
+            url = extract_urls(uri)
+            self.is_url = len(url)
 
         # Grab content of reference
-        if self.is_url:
+        if self.is_stream:
+            self.uri = self.stream_name(uri)
+            self.fn = os.path.basename(self.uri) if self.uri else "document.pdf"
+            self.stream = uri
+
+        elif self.is_url:
             logger.debug("Reading url '%s'..." % uri)
             self.fn = uri.split("/")[-1]
             try:
-                content = urlopen(Request(uri)).read()
-                self.stream = BytesIO(content)
+                self.stream = self.fetch_url(uri)
             except Exception as e:
                 raise DownloadError("Error downloading '%s' (%s)" % (uri, unicode(e)))
 
@@ -121,11 +173,27 @@ class PDFx(object):
             if not os.path.isfile(uri):
                 raise FileNotFoundError("Invalid filename and not an url: '%s'" % uri)
             self.fn = os.path.basename(uri)
-            self.stream = open(uri, "rb")
+            self.stream = self.open_file(uri)
+
+        # Cheap check for the PDF header before handing over to pdfminer
+        # (like Acrobat, accept it anywhere in the first 1024 bytes, counted
+        # from the start even if a passed-in stream hasn't been rewound)
+        self.stream.seek(0)
+        try:
+            header = self.stream.read(1024)
+        except UnicodeDecodeError:
+            header = None
+        self.stream.seek(0)
+        if not isinstance(header, bytes):
+            raise PDFInvalidError("Invalid PDF (stream is not opened in binary mode)")
+        if b"%PDF" not in header:
+            raise PDFInvalidError("Invalid PDF (no PDF header found)")
 
         # Create ReaderBackend instance
         try:
-            self.reader = PDFMinerBackend(self.stream)
+            self.reader = PDFMinerBackend(
+                self.stream, annot_only=annot_only, parse_xmp=parse_xmp, cache=cache
+            )
         except PDFSyntaxError as e:
             raise PDFInvalidError("Invalid PDF (%s)" % unicode(e))
 
@@ -140,18 +208,80 @@ class PDFx(object):
             raise PDFInvalidError("Invalid PDF (%s)" % unicode(e))
 
         # Save metadata to user-supplied directory
-        self.summary = {
+        source_type = "url" if self.is_url else "file"
+        if self.is_stream:
+            source_type = "stream"
+        self._summary = {
             "source": {
-                "type": "url" if self.is_url else "file",
+                "type": source_type,
                 "location": self.uri,
                 "filename": self.fn,
             },
             "metadata": self.reader.get_metadata(),
         }
 
-        # Search for URLs
-        self.summary["references"] = self.reader.get_references_as_dict()
-        # print(self.summary)
+    @property
+    def summary(self):
+        """ Source, metadata and references of the PDF """
+        if "references" not in self._summary:
+            self._summary["references"] = self.reader.get_references_as_dict()
+        return self._summary
+
+    @summary.setter
+    def summary(self, summary):
+        self._summary = summary
+
+    def fetch_url(self, uri):
+        """ Download the PDF at `uri` and return it as a file-like object """
+        # Spool to disk once the PDF exceeds SPOOL_MAX_SIZE bytes
+        stream = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        if PDFx._http is not None and not uses_proxy(uri):
+            resp = PDFx._http.request("GET", uri, preload_content=False)
+            try:
+                if resp.status >= 400:
+                    raise IOError("HTTP Error %s" % resp.status)
+                shutil.copyfileobj(resp, stream, COPY_BUFSIZE)
+            finally:
+                resp.release_conn()
+        else:
+            resp = urlopen(Request(uri))
+            shutil.copyfileobj(resp, stream, COPY_BUFSIZE)
+        stream.seek(0)
+        return stream
+
+    def stream_name(self, stream):
+        """ Filename of the opened `stream` (None if it has none) """
+        # Files opened from a file descriptor are named by its number
+        name = getattr(stream, "name", None)
+        if isinstance(name, bytes):
+            name = name.decode(sys.getfilesystemencoding())
+        return name if isinstance(name, unicode) else None
+
+    def open_file(self, fn):
+        """ Open a local PDF, memory-mapped if possible """
+        f = open(fn, "rb")
+        try:
+            # Let pdfminer's many small reads and seeks hit the page cache
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # Empty and special files cannot be mapped
+            return f
+        f.close()
+        return mm
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Close the stream of the PDF (afterwards it can't be downloaded),
+        unless it was passed in by the caller
+        """
+        if self.stream and not self.is_stream:
+            self.stream.close()
 
     def get_text(self):
         return self.reader.get_text()
@@ -172,7 +302,12 @@ class PDFx(object):
         r = self.reader.get_references(reftype=reftype)
         return len(r)
 
-    def download_pdfs(self, target_dir):
+    def download_pdfs(self, target_dir, pool=None):
+        """
+        Save the PDF, its summary and all referenced PDFs to `target_dir`
+        - `pool` is the `urllib3.PoolManager` for the referenced PDFs
+          (default: `downloader.http_pool`)
+        """
         logger.debug("Download pdfs to %s" % target_dir)
         assert target_dir, "Need a download directory"
         assert not os.path.isfile(target_dir), "Download directory is a file"
@@ -190,8 +325,12 @@ class PDFx(object):
         logger.debug("- Saved original pdf as '%s'" % fn)
 
         fn_json = "%s.infos.json" % fn
-        with open(fn_json, "w") as f:
-            f.write(json.dumps(self.summary, indent=2))
+        if orjson:
+            with open(fn_json, "wb") as f:
+                f.write(orjson.dumps(self.summary, option=orjson.OPT_INDENT_2))
+        else:
+            with open(fn_json, "w") as f:
+                f.write(json.dumps(self.summary, indent=2))
         logger.debug("- Saved metadata to '%s'" % fn_json)
 
         # Download references
@@ -203,4 +342,4 @@ class PDFx(object):
         logger.debug("Downloading %s referenced pdfs..." % len(urls))
 
         # Download urls as a set to avoid duplicates
-        download_urls(urls, dir_referenced_pdfs)
+        download_urls(urls, dir_referenced_pdfs, pool=pool)
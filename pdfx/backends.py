@@ -6,12 +6,19 @@ PDF Backend: pdfMiner
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 import sys
+import copy
+import hashlib
 import logging
-from io import BytesIO
+import threading
+from collections import OrderedDict
+from io import StringIO
 from re import compile
 
-# Character Detection Helper
-import chardet
+# Character Detection Helper (cchardet is a much faster drop-in replacement)
+try:
+    import cchardet as chardet
+except ImportError:
+    import chardet
 
 # Find URLs in text via regex
 from . import extractor
@@ -39,6 +46,14 @@ IS_PY2 = sys.version_info < (3, 0)
 if not IS_PY2:
     # Python 3
     unicode = str
+    intern = sys.intern
+
+# Detect references to PDF files by their extension
+PDF_RE = compile(r"\.pdf(:?\?.*)?$")
+
+# Number of parse results (including the full text) kept by PDFMinerBackend
+# for `cache=True`, keyed by content hash. Set to 0 to disable the cache.
+CACHE_MAXSIZE = 16
 
 
 def make_compat_str(in_str):
@@ -58,18 +73,20 @@ def make_compat_str(in_str):
     if not IS_PY2 and not isinstance(in_str, bytes):
         return in_str
 
-    # Detect the encoding now
-    enc = chardet.detect(in_str)
+    # Most strings are UTF-16 with a byte order mark (BOM), or UTF-8 (which
+    # includes ASCII), and can be decoded without guessing the encoding
+    if in_str[:2] == b"\xfe\xff":
+        return in_str[2:].decode("utf-16-be", "replace")
+    if in_str[:2] == b"\xff\xfe":
+        return in_str[2:].decode("utf-16-le", "replace")
+    try:
+        return in_str.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        pass
 
-    # Decode the object into a unicode object
-    out_str = in_str.decode(enc["encoding"])
-
-    # Cleanup
-    if enc["encoding"] == "UTF-16BE":
-        # Remove byte order marks (BOM)
-        if out_str.startswith("\ufeff"):
-            out_str = out_str[1:]
-    return out_str
+    # Detect the encoding now
+    enc = chardet.detect(in_str)["encoding"] or "latin-1"
+    return in_str.decode(enc, "replace")
 
 
 class Reference(object):
@@ -84,10 +101,8 @@ class Reference(object):
         self.reftype = "url"
         self.page = page
 
-        self.pdf_regex = compile(r"\.pdf(:?\?.*)?$")
-
         # Detect reftype by filetype
-        if self.pdf_regex.search(uri.lower()):
+        if PDF_RE.search(uri.lower()):
             self.reftype = "pdf"
             return
 
@@ -108,7 +123,8 @@ class Reference(object):
         return hash(self.ref)
 
     def __eq__(self, other):
-        assert isinstance(other, Reference)
+        if not isinstance(other, Reference):
+            return NotImplemented
         return self.ref == other.ref
 
     def __str__(self):
@@ -130,6 +146,16 @@ class ReaderBackend(object):
         self.text = ""
         self.metadata = {}
         self.references = set()
+        self._ref_strs = set()  # all uris passed to add_reference
+        self._memo = {}  # cached results of get_references*()
+        self._memo_refs = frozenset()  # self.references when _memo was filled
+
+    def add_reference(self, uri, page=0):
+        """ Adds a Reference to `uri`, unless the same uri was added before """
+        if uri not in self._ref_strs:
+            uri = intern(uri)
+            self._ref_strs.add(uri)
+            self.references.add(Reference(uri, page))
 
     def get_metadata(self):
         return self.metadata
@@ -164,43 +190,135 @@ class ReaderBackend(object):
         return self.text
 
     def get_references(self, reftype=None, sort=False):
+        refs = self._memoize(("list", reftype, sort), self._get_references, reftype, sort)
+        return list(refs) if sort else set(refs)
+
+    def _get_references(self, reftype, sort):
         refs = self.references
         if reftype:
-            refs = set([ref for ref in refs if ref.reftype == "pdf"])
-        return sorted(refs) if sort else refs
+            refs = [ref for ref in refs if ref.reftype == "pdf"]
+        return tuple(sorted(refs, key=lambda ref: ref.ref) if sort else refs)
 
     def get_references_as_dict(self, reftype=None, sort=False):
+        refs = self._memoize(
+            ("dict", reftype, sort), self._get_references_as_dict, reftype, sort
+        )
+        return {k: list(v) for k, v in refs}
+
+    def _get_references_as_dict(self, reftype, sort):
         ret = {}
-        refs = self.references
-        if reftype:
-            refs = set([ref for ref in refs if ref.reftype == "pdf"])
-        for r in sorted(refs) if sort else refs:
+        for r in self.get_references(reftype, sort):
             if r.reftype in ret:
                 ret[r.reftype].append(r.ref)
             else:
                 ret[r.reftype] = [r.ref]
-        return ret
+        return tuple((k, tuple(v)) for k, v in ret.items())
+
+    def _memoize(self, key, func, *args):
+        """
+        Caches the (immutable) results of func until the set of references
+        changes, callers get their own copy to modify
+        """
+        if self._memo_refs != self.references:
+            self._memo = {}
+            self._memo_refs = frozenset(self.references)
+        if key not in self._memo:
+            self._memo[key] = func(*args)
+        return self._memo[key]
 
 
 class PDFMinerBackend(ReaderBackend):
-    def __init__(self, pdf_stream, password="", pagenos=[], maxpages=0):  # noqa: C901
+    # Results of recent parses, so identical PDFs are only parsed once
+    _cache = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(
+        self,
+        pdf_stream,
+        password="",
+        pagenos=[],
+        maxpages=0,
+        annot_only=False,
+        parse_xmp=True,
+        cache=False,
+    ):
+        """
+        Parse metadata, text and references of a PDF
+        - `annot_only` skips text extraction, so only references found in
+          link annotations are collected (much faster on large PDFs)
+        - `parse_xmp=False` only reads the XMP metadata stream if the
+          document info has no title
+        - `cache=True` looks up the PDF by content hash in a process-wide
+          cache of the last `CACHE_MAXSIZE` results, and adds it if missing
+          (costs an extra read of the PDF, so only worth it for repeats)
+        """
         ReaderBackend.__init__(self)
         self.pdf_stream = pdf_stream
 
+        if not cache or CACHE_MAXSIZE <= 0:
+            self.parse(pdf_stream, password, pagenos, maxpages, annot_only, parse_xmp)
+            return
+
+        key = (
+            self.fingerprint(pdf_stream),
+            password,
+            tuple(pagenos),
+            maxpages,
+            annot_only,
+            parse_xmp,
+        )
+        with self._cache_lock:
+            cached = self._cache.pop(key, None)
+            if cached:
+                self._cache[key] = cached
+        if cached:
+            # Copy everything mutable, so that instances stay independent
+            metadata, references, ref_strs, self.text = cached
+            self.metadata = copy.deepcopy(metadata)
+            self.references = set(copy.copy(ref) for ref in references)
+            self._ref_strs = set(ref_strs)
+            return
+
+        self.parse(pdf_stream, password, pagenos, maxpages, annot_only, parse_xmp)
+
+        cached = (
+            copy.deepcopy(self.metadata),
+            frozenset(copy.copy(ref) for ref in self.references),
+            frozenset(self._ref_strs),
+            self.text,
+        )
+        with self._cache_lock:
+            self._cache[key] = cached
+            while len(self._cache) > CACHE_MAXSIZE:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def fingerprint(pdf_stream):
+        """ Returns a hash of the stream content and rewinds the stream """
+        h = hashlib.blake2b(digest_size=16)
+        pdf_stream.seek(0)
+        for chunk in iter(lambda: pdf_stream.read(64 << 10), b""):
+            h.update(chunk)
+        pdf_stream.seek(0)
+        return h.digest()
+
+    def parse(  # noqa: C901
+        self, pdf_stream, password, pagenos, maxpages, annot_only, parse_xmp
+    ):
         # Extract Metadata
         parser = PDFParser(pdf_stream)
         doc = PDFDocument(parser, password=password, caching=True)
         if doc.info:
-            for k in doc.info[0]:
-                v = doc.info[0][k]
-                # print(repr(v), type(v))
-                if isinstance(v, (bytes, str, unicode)):
-                    self.metadata[k] = make_compat_str(v)
-                elif isinstance(v, (psparser.PSLiteral, psparser.PSKeyword)):
-                    self.metadata[k] = make_compat_str(v.name)
+            self.metadata = {
+                k: make_compat_str(v if isinstance(v, (bytes, str, unicode)) else v.name)
+                for k, v in doc.info[0].items()
+                if isinstance(
+                    v, (bytes, str, unicode, psparser.PSLiteral, psparser.PSKeyword)
+                )
+            }
 
         # Secret Metadata
-        if "Metadata" in doc.catalog:
+        if (parse_xmp or not self.metadata.get("Title")) and "Metadata" in doc.catalog:
             metadata = resolve1(doc.catalog["Metadata"]).get_data()
             # print(metadata)  # The raw XMP metadata
             # print(xmp_to_dict(metadata))
@@ -208,13 +326,21 @@ class PDFMinerBackend(ReaderBackend):
             # print("---")
 
         # Extract Content
-        text_io = BytesIO()
-        rsrcmgr = PDFResourceManager(caching=True)
-        converter = TextConverter(
-            rsrcmgr, text_io, codec="utf-8", laparams=LAParams(), imagewriter=None
-        )
-        interpreter = PDFPageInterpreter(rsrcmgr, converter)
-
+        if not annot_only:
+            text_io = StringIO()
+            rsrcmgr = PDFResourceManager(caching=True)
+            converter = TextConverter(
+                rsrcmgr, text_io, codec="utf-8", laparams=LAParams(), imagewriter=None
+            )
+            interpreter = PDFPageInterpreter(rsrcmgr, converter)
+            text_pos = 0
+
+        add_reference = self.add_reference
+        add_references = self.references.update
+
+        # Pages are processed sequentially: page objects are resolved lazily
+        # through the document's parser, which shares a single stream (and
+        # interpreting a page is pure Python, so threads would not help)
         self.metadata["Pages"] = 0
         self.curpage = 0
         for page in PDFPage.get_pages(
@@ -226,96 +352,85 @@ class PDFMinerBackend(ReaderBackend):
             check_extractable=False,
         ):
             # Read page contents
-            interpreter.process_page(page)
+            if not annot_only:
+                interpreter.process_page(page)
             self.metadata["Pages"] += 1
             self.curpage += 1
 
             # Collect URL annotations
-            # try:
-            if page.annots:
-                refs = self.resolve_PDFObjRef(page.annots)
-                if refs:
-                    if isinstance(refs, list):
-                        for ref in refs:
-                            if ref:
-                                self.references.add(ref)
-                    elif isinstance(refs, Reference):
-                        self.references.add(refs)
-
-            # except Exception as e:
-            # logger.warning(str(e))
+            annots = page.annots
+            if annots:
+                add_references(self.resolve_PDFObjRef(annots))
+
+            # Extract URL references from the text of this page
+            if not annot_only:
+                text_io.seek(text_pos)
+                page_text = text_io.read()
+                text_pos = text_io.tell()
+                for ref in extractor.iter_all(page_text):
+                    add_reference(ref, self.curpage)
 
         # Remove empty metadata entries
         self.metadata_cleanup()
 
+        if annot_only:
+            return
+
         # Get text from stream
-        self.text = text_io.getvalue().decode("utf-8")
+        self.text = text_io.getvalue()
         text_io.close()
         converter.close()
         # print(self.text)
 
-        # Extract URL references from text
-        for url in extractor.extract_urls(self.text):
-            self.references.add(Reference(url, self.curpage))
-
-        for ref in extractor.extract_arxiv(self.text):
-            self.references.add(Reference(ref, self.curpage))
-
-        for ref in extractor.extract_doi(self.text):
-            self.references.add(Reference(ref, self.curpage))
-
     def resolve_PDFObjRef(self, obj_ref):
         """
-        Resolves PDFObjRef objects. Returns either None, a Reference object or
-        a list of Reference objects.
+        Resolves PDFObjRef objects (or nested lists of them). Returns a list
+        of the Reference objects found.
         """
-        if isinstance(obj_ref, list):
-            return [self.resolve_PDFObjRef(item) for item in obj_ref]
-
-        # print(">", obj_ref, type(obj_ref))
-        if not isinstance(obj_ref, PDFObjRef):
-            # print("type not of PDFObjRef")
-            return None
-
-        obj_resolved = obj_ref.resolve()
-        # print("obj_resolved:", obj_resolved, type(obj_resolved))
-        if isinstance(obj_resolved, bytes):
-            obj_resolved = obj_resolved.decode("utf-8")
-
-        if isinstance(obj_resolved, (str, unicode)):
-            if IS_PY2:
-                ref = obj_resolved.decode("utf-8")
-            else:
-                ref = obj_resolved
-            return Reference(ref, self.curpage)
-
-        if isinstance(obj_resolved, list):
-            return [self.resolve_PDFObjRef(o) for o in obj_resolved]
-
-        if "URI" in obj_resolved:
-            if isinstance(obj_resolved["URI"], PDFObjRef):
-                return self.resolve_PDFObjRef(obj_resolved["URI"])
-
-        if "A" in obj_resolved:
-            if isinstance(obj_resolved["A"], PDFObjRef):
-                return self.resolve_PDFObjRef(obj_resolved["A"])
-
-            if "URI" in obj_resolved["A"]:
-                # print("->", a["A"]["URI"])
-                return Reference(obj_resolved["A"]["URI"].decode("utf-8"), self.curpage)
+        refs = []
+        seen = set()  # objids already resolved, as refs may form a cycle
+        stack = [obj_ref]
+        while stack:
+            obj = stack.pop()
+            if isinstance(obj, list):
+                stack.extend(reversed(obj))
+                continue
+
+            if type(obj) is not PDFObjRef or obj.objid in seen:
+                continue
+            seen.add(obj.objid)
+
+            obj_resolved = obj.resolve()
+            if isinstance(obj_resolved, bytes):
+                obj_resolved = obj_resolved.decode("utf-8")
+
+            if isinstance(obj_resolved, (str, unicode)):
+                if IS_PY2:
+                    ref = obj_resolved.decode("utf-8")
+                else:
+                    ref = obj_resolved
+                refs.append(Reference(ref, self.curpage))
+
+            elif isinstance(obj_resolved, list):
+                stack.extend(reversed(obj_resolved))
+
+            elif "URI" in obj_resolved and type(obj_resolved["URI"]) is PDFObjRef:
+                stack.append(obj_resolved["URI"])
+
+            elif "A" in obj_resolved:
+                action = obj_resolved["A"]
+                if type(action) is PDFObjRef:
+                    stack.append(action)
+                elif "URI" in action:
+                    refs.append(Reference(action["URI"].decode("utf-8"), self.curpage))
+        return refs
 
 
 class TextBackend(ReaderBackend):
     def __init__(self, stream):
         ReaderBackend.__init__(self)
-        self.text = stream.read()
+        self.text = make_compat_str(stream.read())
 
         # Extract URL references from text
-        for url in extractor.extract_urls(self.text):
-            self.references.add(Reference(url))
-
-        for ref in extractor.extract_arxiv(self.text):
-            self.references.add(Reference(ref))
-
-        for ref in extractor.extract_doi(self.text):
-            self.references.add(Reference(ref))
+        for ref in extractor.iter_all(self.text):
+            self.add_reference(ref)
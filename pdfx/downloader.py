@@ -3,24 +3,38 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 from .colorprint import colorprint, OKGREEN, FAIL
 from .threadpool import ThreadPool
 from collections import defaultdict
+import shutil
 import ssl
 import os
 import sys
+import warnings
+
+try:
+    import urllib3
+except ImportError:
+    # Fall back to urllib for downloads
+    urllib3 = None
 
 IS_PY2 = sys.version_info < (3, 0)
 
 if IS_PY2:
     # Python 2
+    from urllib import getproxies, proxy_bypass
     from urllib2 import Request, urlopen, HTTPError, URLError
+    from urlparse import urlparse
 else:
     # Python 3
+    from urllib.parse import urlparse
     from urllib.request import Request, urlopen, HTTPError, URLError
+    from urllib.request import getproxies, proxy_bypass
 
     unicode = str
 
 
 MAX_THREADS_DEFAULT = 7
 
+USER_AGENT = "Mozilla/5.0 (compatible; MSIE 9.0; Windows NT 6.1; Trident/5.0)"
+
 # Used to allow downloading files even if https certificate doesn't match
 if hasattr(ssl, "_create_unverified_context"):
     ssl_unverified_context = ssl._create_unverified_context()
@@ -29,6 +43,21 @@ else:
     ssl_unverified_context = None
 
 
+def make_pool(maxsize):
+    """
+    Connection pool for up to `maxsize` parallel downloads per host, which
+    doesn't verify certificates like above (None without urllib3)
+    """
+    if not urllib3:
+        return None
+    return urllib3.PoolManager(maxsize=maxsize, cert_reqs="CERT_NONE")
+
+
+# Connection pool shared by all downloads, so that several PDFs from the same
+# host reuse connections
+http_pool = make_pool(MAX_THREADS_DEFAULT)
+
+
 def sanitize_url(url):
     """ Make sure this url works with urllib2 (ascii, http, etc) """
     if url and not url.startswith("http"):
@@ -37,14 +66,20 @@ def sanitize_url(url):
     return url
 
 
+def uses_proxy(url):
+    """
+    True if urllib would fetch url through a proxy (eg. from `http_proxy`),
+    which urllib3 connection pools don't pick up
+    """
+    parsed = urlparse(url)
+    return parsed.scheme in getproxies() and not proxy_bypass(parsed.hostname or "")
+
+
 def get_status_code(url):
     """ Perform HEAD request and return status code """
     try:
         request = Request(sanitize_url(url))
-        request.add_header(
-            "User-Agent",
-            "Mozilla/5.0 (compatible; MSIE 9.0; " "Windows NT 6.1; Trident/5.0)",
-        )
+        request.add_header("User-Agent", USER_AGENT)
         request.get_method = lambda: "HEAD"
         response = urlopen(request, context=ssl_unverified_context)
         # print response.info()
@@ -97,14 +132,51 @@ def check_refs(refs, verbose=True, max_threads=MAX_THREADS_DEFAULT):
                 print(o)
 
 
+def fetch_to_file(url, fn_download, pool=None):
+    """
+    Stream url into the file fn_download and return the HTTP status code
+    (with `pool=None` or a proxy configured, urllib is used instead of urllib3)
+    """
+    url = sanitize_url(url)
+    if pool is None or uses_proxy(url):
+        request = Request(url)
+        request.add_header("User-Agent", USER_AGENT)
+        response = urlopen(request, context=ssl_unverified_context)
+        with open(fn_download, "wb") as f:
+            shutil.copyfileobj(response, f, 64 << 10)
+        return response.getcode()
+
+    response = pool.request(
+        "GET",
+        url,
+        headers={"User-Agent": USER_AGENT},
+        preload_content=False,
+    )
+    try:
+        if response.status == 200:
+            with open(fn_download, "wb") as f:
+                shutil.copyfileobj(response, f, 64 << 10)
+        return response.status
+    finally:
+        response.release_conn()
+
+
 def download_urls(
-    urls, output_directory, verbose=True, max_threads=MAX_THREADS_DEFAULT
+    urls, output_directory, verbose=True, max_threads=MAX_THREADS_DEFAULT, pool=None
 ):
-    """ Download urls to a target directory """
+    """
+    Download urls to a target directory
+    - `pool` is the `urllib3.PoolManager` to use (default: `http_pool`, or a
+      new pool if `max_threads` exceeds its size)
+    """
     assert type(urls) in [list, tuple, set], "Urls must be some kind of list"
     assert len(urls), "Need urls"
     assert output_directory, "Need an output_directory"
 
+    if pool is None:
+        # Each thread needs its own connection to be reused
+        pool = http_pool if max_threads <= MAX_THREADS_DEFAULT else make_pool(max_threads)
+
     def vprint(s):
         if verbose:
             print(s)
@@ -113,20 +185,11 @@ def download_urls(
         try:
             fn = url.split("/")[-1].split("?")[0]
             fn_download = os.path.join(output_directory, fn)
-            with open(fn_download, "wb") as f:
-                request = Request(sanitize_url(url))
-                request.add_header(
-                    "User-Agent",
-                    "Mozilla/5.0 (compatible; "
-                    "MSIE 9.0; Windows NT 6.1; Trident/5.0)",
-                )
-                response = urlopen(request, context=ssl_unverified_context)
-                status_code = response.getcode()
-                if status_code == 200:
-                    f.write(urlopen(request).read())
-                    colorprint(OKGREEN, "Downloaded '%s' to '%s'" % (url, fn_download))
-                else:
-                    colorprint(FAIL, "Error downloading '%s' (%s)" % (url, status_code))
+            status_code = fetch_to_file(url, fn_download, pool)
+            if status_code == 200:
+                colorprint(OKGREEN, "Downloaded '%s' to '%s'" % (url, fn_download))
+            else:
+                colorprint(FAIL, "Error downloading '%s' (%s)" % (url, status_code))
         except HTTPError as e:
             colorprint(FAIL, "Error downloading '%s' (%s)" % (url, e.code))
         except URLError as e:
@@ -140,9 +203,15 @@ def download_urls(
         vprint("Created directory '%s'" % output_directory)
 
     try:
-        pool = ThreadPool(5)
-        pool.map(download_url, urls)
-        pool.wait_completion()
+        # Certificates are not verified on purpose, so silence urllib3's
+        # warning about it (set here rather than in each download thread,
+        # as the filters are process-wide)
+        with warnings.catch_warnings():
+            if urllib3:
+                warnings.simplefilter("ignore", urllib3.exceptions.InsecureRequestWarning)
+            threadpool = ThreadPool(max_threads)
+            threadpool.map(download_url, set(urls))
+            threadpool.wait_completion()
 
     except Exception as e:
         print(e)
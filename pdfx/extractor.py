@@ -9,6 +9,7 @@ Web url matching:
 """
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+import itertools
 import re
 
 # arXiv.org
@@ -22,20 +23,53 @@ DOI_REGEX = r"""DOI:\s?([^\s,]+)"""
 URL_REGEX = r"""(?i)\b((?:https?:(?:/{1,3}|[a-z0-9%])|[a-z0-9.\-]+[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)/)(?:[^\s()<>{}\[\]]+|\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\))+(?:\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'".,<>?«»“”‘’])|(?:(?<!@)[a-z0-9]+(?:[.\-][a-z0-9]+)*[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)\b/?(?!@)))"""  # noqa: E501
 
 
+# Compiled once at import time
+ARXIV_RE = re.compile(ARXIV_REGEX, re.IGNORECASE)
+ARXIV_RE2 = re.compile(ARXIV_REGEX2, re.IGNORECASE)
+DOI_RE = re.compile(DOI_REGEX, re.IGNORECASE)
+URL_RE = re.compile(URL_REGEX, re.IGNORECASE)
+
+
+def iter_urls(text):
+    """ Yields the urls in text (may contain duplicates) """
+    # URLs never contain whitespace and always contain a '.' or ':', so only
+    # the matching words need to go through the (slow) URL regex
+    findall = URL_RE.findall
+    for word in text.split():
+        if "." in word or ":" in word:
+            for url in findall(word):
+                yield url
+
+
+def iter_arxiv(text):
+    """ Yields the arxiv ids in text (may contain duplicates) """
+    for m in ARXIV_RE.finditer(text):
+        yield m.group(1).strip(".")
+    for m in ARXIV_RE2.finditer(text):
+        yield m.group(1).strip(".")
+
+
+def iter_doi(text):
+    """ Yields the dois in text (may contain duplicates) """
+    for m in DOI_RE.finditer(text):
+        yield m.group(1).strip(".")
+
+
+def iter_all(text):
+    """ Yields the urls, arxiv ids and dois in text (may contain duplicates) """
+    return itertools.chain(iter_urls(text), iter_arxiv(text), iter_doi(text))
+
+
 def extract_urls(text):
-    return set(re.findall(URL_REGEX, text, re.IGNORECASE))
+    return set(iter_urls(text))
 
 
 def extract_arxiv(text):
-    res = re.findall(ARXIV_REGEX, text, re.IGNORECASE) + re.findall(
-        ARXIV_REGEX2, text, re.IGNORECASE
-    )
-    return set([r.strip(".") for r in res])
+    return set(iter_arxiv(text))
 
 
 def extract_doi(text):
-    res = set(re.findall(DOI_REGEX, text, re.IGNORECASE))
-    return set([r.strip(".") for r in res])
+    return set(iter_doi(text))
 
 
 if __name__ == "__main__":
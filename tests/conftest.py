@@ -0,0 +1,27 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+# Imported here so pdfx and pdfminer are loaded once per (xdist worker)
+# process, before the first test module is collected
+import pdfx  # noqa: F401
+import pytest
+
+curdir = os.path.dirname(os.path.realpath(__file__))
+
+
+def pytest_collection_modifyitems(config, items):
+    # Benchmarks only run when asked for (`make benchmark`), not with every
+    # test run, and the plugin is optional
+    if config.pluginmanager.hasplugin("benchmark") and config.getoption("benchmark_only"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks only run with --benchmark-only")
+    for item in items:
+        if "benchmark" in getattr(item, "fixturenames", ()):
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def valid_bytes():
+    with open(os.path.join(curdir, "pdfs/valid.pdf"), "rb") as f:
+        return f.read()
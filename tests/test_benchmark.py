@@ -0,0 +1,16 @@
+from __future__ import absolute_import, division, print_function
+
+import io
+import pdfx
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+
+def parse_references(data):
+    return pdfx.PDFx(io.BytesIO(data)).get_references_as_dict()
+
+
+def test_valid_refs_perf(benchmark, valid_bytes):
+    refs = benchmark(parse_references, valid_bytes)
+    assert len(refs["pdf"]) == 18
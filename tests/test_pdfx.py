@@ -1,30 +1,258 @@
 from __future__ import absolute_import, division, print_function
 
+import asyncio
+import io
+import json
 import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
 import pdfx
 import pytest
 
 curdir = os.path.dirname(os.path.realpath(__file__))
 
+PDFS = os.path.join(curdir, "pdfs")
+VALID_PDF = os.path.join(PDFS, "valid.pdf")
+INVALID_PDF = os.path.join(PDFS, "invalid.pdf")
+I14_DOC1 = os.path.join(PDFS, "i14doc1.pdf")
+I14_DOC2 = os.path.join(PDFS, "i14doc2.pdf")
+
+
+class NotFoundHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_error(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class PDFHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.end_headers()
+        with open(VALID_PDF, "rb") as f:
+            self.wfile.write(f.read())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def valid_pdf():
+    return pdfx.PDFx(VALID_PDF)
+
+
+@pytest.fixture(scope="session")
+def valid_urls(valid_pdf):
+    return valid_pdf.get_references_as_dict()
+
+
+@pytest.fixture(scope="session")
+def url_404():
+    """ Url served by a local HTTP server which responds with a 404 """
+    server = HTTPServer(("127.0.0.1", 0), NotFoundHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield "http://127.0.0.1:%s/404.pdf" % server.server_address[1]
+    server.shutdown()
 
-def test_all():
-    with pytest.raises(pdfx.exceptions.FileNotFoundError):
-        pdfx.PDFx("asd")
 
+@pytest.fixture
+def pdf_server():
+    """ Local HTTP server which responds to every GET with valid.pdf """
+    server = HTTPServer(("127.0.0.1", 0), PDFHandler)
+    server.paths = []
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize(
+    "uri, exc",
+    [
+        ("asd", pdfx.exceptions.FileNotFoundError),
+        (INVALID_PDF, pdfx.exceptions.PDFInvalidError),
+    ],
+)
+def test_error_paths(uri, exc):
+    with pytest.raises(exc):
+        pdfx.PDFx(uri)
+
+
+@pytest.mark.timeout(5, method="thread")
+def test_download_error(url_404):
     with pytest.raises(pdfx.exceptions.DownloadError):
-        pdfx.PDFx("http://invalid.com/404.pdf")
+        pdfx.PDFx(url_404)
+
+
+@pytest.mark.network
+@pytest.mark.timeout(30, method="thread")
+def test_remote_pdf():
+    pdf = pdfx.PDFx("https://weakdh.org/imperfect-forward-secrecy.pdf")
+    assert len(pdf.get_references(reftype="pdf")) == 18
+
+
+def test_valid_pdf_refs(valid_urls):
+    assert len(valid_urls["pdf"]) == 18
+    assert len(valid_urls["url"]) == 18
+
+
+def test_stream(valid_bytes):
+    pdf = pdfx.PDFx(io.BytesIO(valid_bytes), annot_only=True)
+    assert pdf.summary["source"]["type"] == "stream"
+    pdf_file = pdfx.PDFx(VALID_PDF, annot_only=True)
+    assert pdf.get_references(sort=True) == pdf_file.get_references(sort=True)
+
+
+def test_unnamed_stream(valid_bytes):
+    with tempfile.TemporaryFile() as f:
+        f.write(valid_bytes)
+        with pdfx.PDFx(f, annot_only=True) as pdf:
+            assert pdf.fn == "document.pdf"
+        assert not f.closed
+
 
-    with pytest.raises(pdfx.exceptions.PDFInvalidError):
-        pdfx.PDFx(os.path.join(curdir, "pdfs/invalid.pdf"))
+def test_unrewound_stream(valid_bytes):
+    buf = io.BytesIO()
+    buf.write(valid_bytes)
+    pdf = pdfx.PDFx(buf, annot_only=True)
+    assert len(pdf.get_references(reftype="pdf")) == 18
 
-    pdf = pdfx.PDFx(os.path.join(curdir, "pdfs/valid.pdf"))
-    urls = pdf.get_references(reftype="pdf")
-    assert len(urls) == 18
-    # pdf.download_pdfs("/tmp/")
+
+def test_text_stream():
+    with open(VALID_PDF) as f:
+        with pytest.raises(pdfx.exceptions.PDFInvalidError):
+            pdfx.PDFx(f)
 
 
 def test_two_pdfs():
     # See https://github.com/metachris/pdfx/issues/14
-    pdfx.PDFx(os.path.join(curdir, "pdfs/i14doc1.pdf"))
-    pdf_2 = pdfx.PDFx(os.path.join(curdir, "pdfs/i14doc2.pdf"))
-    assert len(pdf_2.get_references()) == 2
+    # Both PDFs are parsed concurrently, in threads of the default executor
+    loop = asyncio.new_event_loop()
+    try:
+        _, pdf_2 = loop.run_until_complete(
+            asyncio.gather(
+                loop.run_in_executor(None, pdfx.PDFx, I14_DOC1),
+                loop.run_in_executor(None, pdfx.PDFx, I14_DOC2),
+            )
+        )
+    finally:
+        loop.close()
+    refs = pdf_2.get_references()
+    assert len(refs) == 2
+
+
+def test_annot_only():
+    pdf = pdfx.PDFx(VALID_PDF, annot_only=True)
+    assert pdf.get_text() == ""
+    assert len(pdf.get_references(reftype="pdf")) == 18
+
+
+def test_cached_parse(valid_pdf, monkeypatch):
+    pdf = pdfx.PDFx(VALID_PDF, cache=True)
+    pdf.get_metadata()["Title"] = "changed"
+    ref = next(iter(pdf.get_references()))
+    ref.page = -1
+
+    def parse(*args):
+        raise AssertionError("cached PDF parsed again")
+
+    monkeypatch.setattr(pdfx.backends.PDFMinerBackend, "parse", parse)
+    pdf_2 = pdfx.PDFx(VALID_PDF, cache=True)
+    assert pdf_2.get_metadata()["Title"] != "changed"
+    assert pdf_2.get_references() == valid_pdf.get_references()
+    assert all(ref.page != -1 for ref in pdf_2.get_references())
+    assert pdf_2.get_text() == valid_pdf.get_text()
+
+    with pytest.raises(AssertionError):
+        pdfx.PDFx(VALID_PDF)
+
+
+def test_references_cached(valid_pdf):
+    refs = valid_pdf.get_references_as_dict()
+    assert valid_pdf.get_references_as_dict() == refs
+    assert valid_pdf.summary["references"] == refs
+
+
+def test_references_copied(valid_bytes):
+    pdf = pdfx.PDFx(io.BytesIO(valid_bytes), annot_only=True)
+    pdf.get_references_as_dict()["pdf"].clear()
+    pdf.get_references(reftype="pdf").clear()
+    assert len(pdf.get_references_as_dict()["pdf"]) == 18
+    assert len(pdf.summary["references"]["pdf"]) == 18
+
+    # Replacing a reference (same count) invalidates the cached results
+    ref = next(iter(pdf.get_references(reftype="pdf")))
+    pdf.reader.references.remove(ref)
+    pdf.reader.references.add(pdfx.backends.Reference("http://a.com/new.pdf"))
+    pdf_refs = pdf.get_references_as_dict()["pdf"]
+    assert ref.ref not in pdf_refs and "http://a.com/new.pdf" in pdf_refs
+
+
+def test_reference_eq():
+    ref = pdfx.backends.Reference("http://a.com")
+    assert ref == pdfx.backends.Reference("http://a.com")
+    assert ref != "http://a.com"
+
+
+def test_summary_setter(valid_bytes):
+    pdf = pdfx.PDFx(io.BytesIO(valid_bytes), annot_only=True)
+    pdf.summary = {"references": {}}
+    assert pdf.summary == {"references": {}}
+
+
+@pytest.mark.timeout(5, method="thread")
+def test_cyclic_annots():
+    # An annotation array which contains a reference to itself
+    class Doc(object):
+        def getobj(self, objid):
+            return objs[objid]
+
+    PDFObjRef = pdfx.backends.PDFObjRef
+    objs = {1: [PDFObjRef(Doc(), 1, 0), PDFObjRef(Doc(), 2, 0)], 2: b"http://a.com/b.pdf"}
+    backend = pdfx.backends.PDFMinerBackend.__new__(pdfx.backends.PDFMinerBackend)
+    backend.curpage = 1
+    refs = backend.resolve_PDFObjRef(PDFObjRef(Doc(), 1, 0))
+    assert [ref.ref for ref in refs] == ["http://a.com/b.pdf"]
+
+
+@pytest.mark.timeout(10, method="thread")
+def test_proxy(pdf_server, tmp_path, monkeypatch):
+    monkeypatch.setenv("http_proxy", "http://127.0.0.1:%s" % pdf_server.server_port)
+    monkeypatch.setenv("no_proxy", "")
+    pdf = pdfx.PDFx("http://example.invalid/proxied.pdf", annot_only=True)
+    assert pdf.get_metadata()["Pages"] > 0
+    pdfx.downloader.fetch_to_file(
+        "http://example.invalid/ref.pdf",
+        str(tmp_path / "ref.pdf"),
+        pdfx.downloader.http_pool,
+    )
+    assert pdf_server.paths == [
+        "http://example.invalid/proxied.pdf",
+        "http://example.invalid/ref.pdf",
+    ]
+
+
+@pytest.mark.timeout(10, method="thread")
+def test_download_pdfs(valid_bytes, pdf_server, tmp_path):
+    pdf = pdfx.PDFx(io.BytesIO(valid_bytes), annot_only=True)
+    url = "http://127.0.0.1:%s/%%s.pdf" % pdf_server.server_port
+    pdf.reader.references = set(pdfx.backends.Reference(url % i) for i in range(3))
+    pdf.download_pdfs(str(tmp_path), pool=pdfx.downloader.make_pool(2))
+
+    assert (tmp_path / "document.pdf").read_bytes() == valid_bytes
+    with open(str(tmp_path / "document.pdf.infos.json"), "rb") as f:
+        summary = json.loads(f.read().decode("utf-8"))
+    assert summary["source"]["type"] == "stream"
+    assert sorted(summary["references"]["pdf"]) == [url % i for i in range(3)]
+    for i in range(3):
+        fn = tmp_path / "document.pdf-referenced-pdfs" / ("%s.pdf" % i)
+        assert fn.read_bytes() == valid_bytes